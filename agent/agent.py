@@ -1,16 +1,83 @@
+import asyncio
 import base64
+import threading
 import time
-from typing import Callable, List, Dict, Any, Generator
-from openai import OpenAI
+import traceback
+from typing import Callable, List, Dict, Any, Generator, AsyncGenerator
+from openai import AsyncOpenAI
 from openai.types.responses import ResponseOutputItem
 
 from computers.computer import Computer
 from utils import check_blocklisted_url
-from .prompts import COMPUTER_USER_AGENT_SYSTEM_PROMPT
+from .prompts import COMPUTER_USER_AGENT_SYSTEM_PROMPT, current_date_context
+
+# Seconds to let each action take effect before the next action or screenshot
+_POST_ACTION_DELAY = {
+    "click": 0.3,
+    "double_click": 0.3,
+    "keypress": 0.05,
+    "type": 0.05,
+    "move": 0.0,
+    "scroll": 0.1,
+    "drag": 0.2,
+    "screenshot": 0.0,
+    "wait": 0.0,  # Already waits
+}
+
+
+def _wait_ms(action) -> int:
+    """Wait duration of a wait action in ms, defaulting to 1 second."""
+    params = getattr(action, "params", None)
+    for source, name in ((params, "ms"), (action, "ms"), (params, "time"), (action, "time")):
+        ms = getattr(source, name, None)
+        if ms is not None:
+            return ms
+    return 1000
+
+
+# Extract the computer method parameters from a computer call action, by action type
+_EXTRACTORS: Dict[str, Callable[[Any], Dict[str, Any]]] = {
+    "click": lambda a: {"x": a.x, "y": a.y, "button": getattr(a, "button", "left")},
+    "double_click": lambda a: {"x": a.x, "y": a.y},
+    "type": lambda a: {"text": a.text},
+    "keypress": lambda a: {"keys": a.keys if isinstance(a.keys, list) else [a.keys]},
+    "scroll": lambda a: {"x": a.x, "y": a.y, "scroll_x": a.scroll_x, "scroll_y": a.scroll_y},
+    "drag": lambda a: {"path": [{"x": point.x, "y": point.y} for point in a.path]},
+    "move": lambda a: {"x": a.x, "y": a.y},
+    "wait": lambda a: {"ms": _wait_ms(a)},
+    "screenshot": lambda a: {},
+}
+
+
+def _is_page_changing(action_type: str, params: Dict[str, Any]) -> bool:
+    """
+    Return True if the action is likely to change the page, so the model
+    needs a fresh screenshot before any further action is executed.
+    """
+    if action_type in ("click", "scroll"):
+        return True
+    if action_type == "keypress":
+        return any(key.upper() in ("ENTER", "RETURN") for key in params.get("keys", []))
+    return False
+
+
+def _is_mutating(action_type: str) -> bool:
+    """
+    Return True if the action changes the screen state, so it has to run in
+    order with the other actions. Non-mutating actions (move, wait,
+    screenshot) can run concurrently with each other, as long as a wait
+    still precedes the actions that follow it.
+    """
+    return action_type not in ("move", "wait", "screenshot")
+
 
 class Agent:
     """
     An agent class that interacts with a computer using OpenAI's Response API.
+    
+    The conversation loop is asynchronous (run_conversation_async); blocking
+    computer calls run on worker threads so screenshots and URL lookups can
+    overlap. run_conversation is a synchronous wrapper for non-async callers.
     """
 
     def __init__(
@@ -23,6 +90,7 @@ class Agent:
         show_images=False,
         acknowledge_safety_check_callback: Callable = lambda message: True,
         system_prompt=None,
+        max_actions_per_turn=5,
     ):
         """
         Initialize the agent.
@@ -35,8 +103,11 @@ class Agent:
             debug: Whether to print debug information
             show_images: Whether to display images
             acknowledge_safety_check_callback: Callback for safety checks
+            system_prompt: System prompt override
+            max_actions_per_turn: Maximum number of actions executed from a
+                single model response before returning a screenshot
         """
-        self.client = OpenAI(api_key=api_key)
+        self.client = AsyncOpenAI(api_key=api_key)
         self.model = model
         self.computer = computer
         self.print_steps = print_steps
@@ -45,6 +116,16 @@ class Agent:
         self.acknowledge_safety_check_callback = acknowledge_safety_check_callback
         self.last_response_id = None
         self.system_prompt = system_prompt or COMPUTER_USER_AGENT_SYSTEM_PROMPT
+        self.max_actions_per_turn = max_actions_per_turn
+        self._loop = None  # Background event loop used by run_conversation
+        self._last_screenshot = None  # Last screenshot sent to the model
+        self._last_image_url = None  # Data URL built from _last_screenshot
+        # Computer methods by action type, resolved once
+        self._methods = {
+            action_type: getattr(computer, action_type)
+            for action_type in _EXTRACTORS
+            if hasattr(computer, action_type)
+        }
         
         # Define tools for computer interaction - simple tool definition for Computer Use
         self.tools = [
@@ -56,226 +137,251 @@ class Agent:
             }
         ]
 
-    def handle_item(self, computer_call: ResponseOutputItem):
+    def reset(self):
+        """
+        Forget the current conversation, so the next run_conversation starts
+        a new one (with the system prompt) and sends a fresh screenshot.
+        """
+        self.last_response_id = None
+        self._last_screenshot = None
+        self._last_image_url = None
+
+    def execute_action(self, computer_call: ResponseOutputItem):
         """
-        Handle a computer call from the model.
+        Execute the action of a computer call without taking a screenshot.
         
         Args:
             computer_call: The computer call object from the model response
             
         Returns:
-            The call_id and a dictionary with the results for the next API call
+            The action type and the parameters the action was executed with
         """
-        call_id = computer_call.call_id
         action = computer_call.action
         action_type = action.type
         
         if self.debug:
             print(f"Handling computer call: {action_type}")
-            print(f"Computer call structure: {dir(computer_call)}")
-            print(f"Action structure: {dir(action)}")
         
-        # Extract action parameters based on the action type
+        extract = _EXTRACTORS.get(action_type)
+        method = self._methods.get(action_type)
+        if extract is None or method is None:
+            raise ValueError(f"Unknown action type: {action_type}")
         try:
-            if action_type == "click":
-                # Try various parameter structures
-                try:
-                    # Try direct params access
-                    if hasattr(action, "x") and hasattr(action, "y"):
-                        x = action.x
-                        y = action.y
-                        button = getattr(action, "button", "left")
-                    else:
-                        raise ValueError("Could not extract coordinates for click action")
-                    
-                    params = {"x": x, "y": y, "button": button}
-                except Exception as e:
-                    if self.debug:
-                        print(f"Error extracting click parameters: {e}")
-                    raise e
-                
-            elif action_type == "type":
-                # Try different parameter structures for 'type' action
-                if hasattr(action, "text"):
-                    text = action.text
-                else:
-                    raise ValueError("Could not extract text for type action")
-                
-                params = {"text": text}
-                
-            elif action_type == "keypress":
-                # Get keys from various locations
-                if hasattr(action, "keys"):
-                    keys = action.keys
-                else:
-                    raise ValueError("Could not extract keys for keypress action")
-                
-                # Ensure keys is a list
-                if not isinstance(keys, list):
-                    keys = [keys]
-                
-                params = {"keys": keys}
-                
-            elif action_type == "scroll":
-                # Try various parameter structures
-                try:
-                    if hasattr(action, "scroll_x") and hasattr(action, "scroll_y"):
-                        x = action.x
-                        y = action.y
-                    else:
-                        raise ValueError("Could not extract scroll parameters")
-                    params = {"x": x, "y": y, "scroll_x": action.scroll_x, "scroll_y": action.scroll_y}                  
-                    
-                except Exception as e:
-                    if self.debug:
-                        print(f"Error extracting scroll parameters: {e}")
-                    raise e
-                
-            elif action_type == "double_click":
-                # Try various parameter structures
-                try:
-                    if hasattr(action, "x") and hasattr(action, "y"):
-                        x = action.x
-                        y = action.y
-                    else:
-                        raise ValueError("Could not extract coordinates for double_click action")
-                    
-                    params = {"x": x, "y": y}
-                except Exception as e:
-                    if self.debug:
-                        print(f"Error extracting double_click parameters: {e}")
-                    raise e
-                
-            elif action_type == "drag":
-                # Try various parameter structures
-                try:
-                    path_data = None
-                    if hasattr(action, "path"):
-                        path_data = action.path
-                    
-                    if not path_data:
-                        raise ValueError("Could not extract path for drag action")
-                    
-                    path = []
-                    for point in path_data:
-                        path.append({"x": point.x, "y": point.y})
-                    
-                    params = {"path": path}
-                except Exception as e:
-                    if self.debug:
-                        print(f"Error extracting drag parameters: {e}")
-                    raise e
-                    
-            elif action_type == "wait":
-                # Extract the wait time (ms) parameter
-                try:
-                    # Try different parameter structures
-                    if hasattr(action, "params") and hasattr(action.params, "ms"):
-                        ms = action.params.ms
-                    elif hasattr(action, "ms"):
-                        ms = action.ms
-                    elif hasattr(action, "params") and hasattr(action.params, "time"):
-                        ms = action.params.time
-                    elif hasattr(action, "time"):
-                        ms = action.time
-                    else:
-                        # Default to 1000ms (1 second) if not specified
-                        ms = 1000
-                        
-                    params = {"ms": ms}
-                except Exception as e:
-                    if self.debug:
-                        print(f"Error extracting wait parameters: {e}")
-                    # Default to 1000ms (1 second) if there's an error
-                    params = {"ms": 1000}
-            
-            elif action_type == "screenshot":
-                # No parameters needed for screenshot action
-                params = {}
-            elif action_type == "move":
-                # def move(self, x: int, y: int) -> None:
-                # self._exec(f"DISPLAY={self.display} xdotool mousemove {x} {y}")
-                # Extract x and y coordinates
-                try:
-                    if hasattr(action, "x") and hasattr(action, "y"):
-                        x = action.x
-                        y = action.y
-                    else:
-                        raise ValueError("Could not extract coordinates for move action")
-                    
-                    params = {"x": x, "y": y}
-                except Exception as e:
-                    if self.debug:
-                        print(f"Error extracting move parameters: {e}")
-                    raise e                
-            else:
-                if self.debug:
-                    print(f"Unknown action type: {action_type}")
-                raise ValueError(f"Unknown action type: {action_type}")
-            
-        except Exception as e:
-            if self.debug:
-                print(f"Error determining action parameters: {e}")
-                import traceback
-                traceback.print_exc()
-            raise e
+            params = extract(action)
+        except AttributeError as e:
+            raise ValueError(f"Could not extract parameters for {action_type} action: {e}") from e
         
         if self.print_steps:
             print(f"Action: {action_type}")
             print(f"Parameters: {params}")
         
         try:
-            # Execute the action using the computer method
-            method = getattr(self.computer, action_type)
-            method(**params)
-            
-            # Wait for action to take effect (except for wait action, which already waits)
-            if action_type != "wait":
-                time.sleep(0.5)
-            
-            # Get a screenshot after the action
-            screenshot_base64 = self.computer.screenshot()
-            
-            # Handle safety checks if present
-            pending_checks = getattr(computer_call, "pending_safety_checks", [])
-            for check in pending_checks:
-                message = getattr(check, "message", "Safety check with no message")
-                if not self.acknowledge_safety_check_callback(message):
-                    raise ValueError(
-                        f"Safety check failed: {message}. Cannot continue with unacknowledged safety checks."
-                    )
-            
-            # Return the call_id and the screenshot for the next API call
-            # return value informs model of the latest screenshot
-            call_output = {
-                "type": "computer_call_output",
-                "call_id": computer_call.call_id,
-                "acknowledged_safety_checks": pending_checks,
-                "output": {
-                    "type": "input_image",
-                    "image_url": f"data:image/png;base64,{screenshot_base64}",
-                },
-            }
-
-            # additional URL safety checks for browser environments
-            if self.computer.environment == "browser":
-                current_url = self.computer.get_current_url()
-                call_output["output"]["current_url"] = current_url
-                check_blocklisted_url(current_url)
-
-            return [call_output], {"action": action_type, "params": params}
-            
+            # The batch captures the screen once after its last action, which
+            # also answers screenshot actions
+            if action_type != "screenshot":
+                method(**params)
         except Exception as e:
             if self.debug:
                 print(f"Error executing {action_type}: {e}")
-                import traceback
                 traceback.print_exc()
-            raise e
+            raise
         
+        # Wait for action to take effect
+        delay = _POST_ACTION_DELAY.get(action_type, 0.5)
+        if delay:
+            time.sleep(delay)
+
+        return action_type, params
+
+    def build_call_output(self, computer_call: ResponseOutputItem, screenshot_base64: str, current_url: str = None, executed: bool = True):
+        """
+        Build the computer_call_output item that answers a computer call.
+        
+        Args:
+            computer_call: The computer call object from the model response
+            screenshot_base64: The screenshot taken after the action
+            current_url: The current browser URL (browser environments only)
+            executed: Whether the call's action was executed; safety checks
+                are only acknowledged for executed calls
+            
+        Returns:
+            A dictionary with the results for the next API call
+        """
+        # Handle safety checks if present
+        pending_checks = getattr(computer_call, "pending_safety_checks", []) if executed else []
+        for check in pending_checks:
+            message = getattr(check, "message", "Safety check with no message")
+            if not self.acknowledge_safety_check_callback(message):
+                raise ValueError(
+                    f"Safety check failed: {message}. Cannot continue with unacknowledged safety checks."
+                )
+        
+        # Only rebuild the data URL if the screen changed since the last call
+        if screenshot_base64 != self._last_screenshot:
+            self._last_screenshot = screenshot_base64
+            mime_type = getattr(self.computer, "screenshot_mime_type", "image/png")
+            self._last_image_url = f"data:{mime_type};base64,{screenshot_base64}"
+        elif self.debug:
+            print("Screen unchanged, reusing last screenshot")
+
+        # return value informs model of the latest screenshot
+        call_output = {
+            "type": "computer_call_output",
+            "call_id": computer_call.call_id,
+            "acknowledged_safety_checks": pending_checks,
+            "output": {
+                "type": "input_image",
+                "image_url": self._last_image_url,
+            },
+        }
+        if current_url is not None:
+            call_output["output"]["current_url"] = current_url
+        return call_output
+
+    async def capture_state(self, wait_until_stable: bool = False):
+        """
+        Take a screenshot of the current state and, for browser environments,
+        look up and check the current URL. Both run on worker threads and
+        overlap each other, except while waiting for the screen to settle:
+        the URL is then looked up after the last screenshot, so both describe
+        the page the navigation led to, and reused if the screen is unchanged.
+        
+        Args:
+            wait_until_stable: Poll screenshots until the screen stops changing
+            
+        Returns:
+            The base64 screenshot and the current URL (None outside browsers)
+        """
+        if wait_until_stable:
+            take_screenshot = self._wait_until_stable()
+        else:
+            take_screenshot = asyncio.to_thread(self.computer.screenshot)
+
+        if self.computer.environment != "browser":
+            return await take_screenshot, None
+
+        # additional URL safety checks for browser environments
+        if wait_until_stable:
+            screenshot_base64 = await take_screenshot
+            # Computers that hash their screenshots cache the URL per screen
+            # content; the lookup is then free if the page didn't change
+            screen_hash = getattr(self.computer, "screenshot_hash", None)
+            if screen_hash is not None:
+                current_url = await asyncio.to_thread(self.computer.get_current_url, screen_hash)
+            else:
+                current_url = await asyncio.to_thread(self.computer.get_current_url)
+        else:
+            screenshot_base64, current_url = await asyncio.gather(
+                take_screenshot,
+                asyncio.to_thread(self.computer.get_current_url),
+            )
+        check_blocklisted_url(current_url)
+        return screenshot_base64, current_url
+
+    async def _wait_until_stable(self, timeout: float = 1.0, interval: float = 0.06) -> str:
+        """
+        Poll screenshots until two consecutive ones are identical or the
+        timeout expires, e.g. while a page loads after a click.
+        
+        Returns:
+            The last screenshot taken
+        """
+        deadline = time.monotonic() + timeout
+        screenshot_base64 = await asyncio.to_thread(self.computer.screenshot)
+        # Compare content hashes where the computer provides them
+        last_key = getattr(self.computer, "screenshot_hash", None) or screenshot_base64
+        while time.monotonic() < deadline:
+            await asyncio.sleep(interval)
+            screenshot_base64 = await asyncio.to_thread(self.computer.screenshot)
+            key = getattr(self.computer, "screenshot_hash", None) or screenshot_base64
+            if key == last_key:
+                break
+            last_key = key
+        return screenshot_base64
+
+    async def run_computer_calls(self, computer_calls: List[ResponseOutputItem], items: List[Dict[str, Any]]) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Execute a batch of computer calls from a single model response.
+        
+        The calls are executed in order without screenshots in between;
+        consecutive non-mutating calls run concurrently, up to and including
+        a wait, so calls after a wait still follow it. The batch is cut
+        short after a page-changing action or after
+        max_actions_per_turn actions; the remaining calls are not executed and
+        are answered with the same screenshot so the model can re-plan from the
+        new screen state.
+        
+        Args:
+            computer_calls: The computer call objects from the model response
+            items: The input items of the next API call; the call outputs are
+                appended to it
+            
+        Returns:
+            An async generator that yields an update per executed action
+        """
+        executed = 0
+        page_changed = False
+        while executed < len(computer_calls) and executed < self.max_actions_per_turn:
+            # Run consecutive non-mutating calls concurrently; at most one
+            # move per group so the final pointer position stays defined
+            group = []
+            for computer_call in computer_calls[executed:self.max_actions_per_turn]:
+                action_type = computer_call.action.type
+                if _is_mutating(action_type) or (
+                    action_type == "move" and any(c.action.type == "move" for c in group)
+                ):
+                    break
+                group.append(computer_call)
+                # A wait only overlaps the calls before it; later calls must
+                # still run after it
+                if action_type == "wait":
+                    break
+            if not group:
+                group = [computer_calls[executed]]
+
+            results = await asyncio.gather(
+                *(asyncio.to_thread(self.execute_action, computer_call) for computer_call in group)
+            )
+            executed += len(group)
+            for action_type, params in results:
+                yield {"action": action_type, "params": params}
+
+            # A group of several calls only holds non-mutating actions
+            action_type, params = results[-1]
+            page_changed = _is_page_changing(action_type, params)
+            if page_changed:
+                break
+
+        skipped = len(computer_calls) - executed
+        if skipped:
+            reason = "after screen change" if page_changed else f"over the limit of {self.max_actions_per_turn} per turn"
+            if self.print_steps:
+                print(f"Skipped {skipped} action(s) {reason}")
+
+        # Only capture the screen once, after the last action of the batch;
+        # after navigation, wait for the screen to settle first
+        screenshot_base64, current_url = await self.capture_state(wait_until_stable=page_changed)
+        items.extend(
+            self.build_call_output(computer_call, screenshot_base64, current_url, executed=index < executed)
+            for index, computer_call in enumerate(computer_calls)
+        )
+        if skipped:
+            # The skipped calls' outputs look like the executed ones; say which they were
+            items.append({
+                "role": "user",
+                "content": (
+                    f"Actions {executed + 1}-{len(computer_calls)} of your last turn were not executed "
+                    f"({reason}); re-issue them if they are still needed."
+                ),
+            })
 
     def run_conversation(self, user_input: str, should_stop_callback=None) -> Generator[Dict[str, Any], None, None]:
         """
-        Run a conversation with the model.
+        Run a conversation with the model from synchronous code.
+        
+        The async conversation is driven on a background event loop owned by
+        the agent, so this also works where the calling thread already runs
+        an event loop (e.g. Jupyter).
         
         Args:
             user_input: The user input to send to the model.
@@ -284,16 +390,46 @@ class Agent:
         Returns:
             A generator that yields updates as they are received.
         """
+        loop = self._get_loop()
+        updates = self.run_conversation_async(user_input, should_stop_callback)
+        try:
+            while True:
+                try:
+                    yield asyncio.run_coroutine_threadsafe(updates.__anext__(), loop).result()
+                except StopAsyncIteration:
+                    break
+        finally:
+            asyncio.run_coroutine_threadsafe(updates.aclose(), loop).result()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """Return the background event loop, starting it on first use."""
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._loop.run_forever, name="agent-loop", daemon=True).start()
+        return self._loop
+
+    async def run_conversation_async(self, user_input: str, should_stop_callback=None) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Run a conversation with the model.
+        
+        Args:
+            user_input: The user input to send to the model.
+            should_stop_callback: An optional callback that returns True if the conversation should stop.
+            
+        Returns:
+            An async generator that yields updates as they are received.
+        """
         items = []
         if not self.last_response_id:
             items.append({"role": "system", "content": self.system_prompt})
+            items.append({"role": "user", "content": current_date_context()})
         items.append({"role": "user", "content": user_input})
         continue_conversation = True
 
         while continue_conversation:            
 
             try:
-                response = self.client.responses.create(
+                response = await self.client.responses.create(
                     model=self.model,
                     previous_response_id=self.last_response_id if self.last_response_id else None,
                     tools=self.tools,
@@ -302,12 +438,16 @@ class Agent:
                     truncation="auto"
                 )
                 self.last_response_id = response.id
+                # previous_response_id carries everything sent so far, so the
+                # next request only needs the new items (call outputs, etc.)
+                items = []
 
                 if not response.output:
                     print(response)
                     raise ValueError("No output from model")
 
                 continue_conversation = False  # Assume no further actions until proven otherwise.
+                computer_calls = []
                 for item in response.output:                    
                     if hasattr(item, 'role') and item.role == "assistant":
                         yield {"role": item.role, "content": item.content[0].text}
@@ -317,17 +457,20 @@ class Agent:
                             reasoning_text = '\n'.join([x.text for x in item.summary])
                         yield {"role": "reasoning", "content": reasoning_text}
                     elif item.type == "computer_call":
-                        result_items, action_obj = self.handle_item(item)
-                        items.extend(result_items)
-                        continue_conversation = True
-                        yield action_obj
+                        computer_calls.append(item)
+
+                # Execute all computer calls of this turn and answer them together
+                if computer_calls:
+                    async for update in self.run_computer_calls(computer_calls, items):
+                        yield update
+                    continue_conversation = True
 
                 # Flush any pending items before the next iteration.
                 # Check if we should stop via the callback before making an API call.
                 if should_stop_callback and should_stop_callback():
                     items.append({"role": "user", "content": "Operation stopped by user. No further actions required until user input."})
                     try:
-                        flush_response = self.client.responses.create(
+                        flush_response = await self.client.responses.create(
                             model=self.model,
                             previous_response_id=self.last_response_id,
                             tools=self.tools,
@@ -1,12 +1,57 @@
 import subprocess
 import time
 import base64
+import hashlib
+import json
 import os
+import shlex
 import socket
-from typing import List, Dict, Optional, Tuple, Literal
+import threading
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple, Literal
 
 from computers.computer import Computer
 
+if TYPE_CHECKING:
+    import docker
+
+# Marker printed after every command in the persistent shell session, followed
+# by the command's exit status and output size; the raw output comes next.
+_SENTINEL = "__END__"
+
+# How long and how often to poll the container health after starting it
+_HEALTH_TIMEOUT = 10.0
+_HEALTH_INTERVAL = 0.2
+
+# Initial size of the reusable screenshot buffer; it grows as needed
+_SCREENSHOT_BUFFER_SIZE = 1 << 20
+
+# Location of container_agent.py inside the image (see Dockerfile)
+_HELPER_PATH = "/home/myuser/container_agent.py"
+
+# Key names used by the model mapped to xdotool/X keysym names
+_KEY_MAP = {
+    "ENTER": "Return",
+    "LEFT": "Left",
+    "RIGHT": "Right",
+    "UP": "Up",
+    "DOWN": "Down",
+    "ESC": "Escape",
+    "SPACE": "space",
+    "BACKSPACE": "BackSpace",
+    "TAB": "Tab",
+    "CTRL": "ctrl",
+    "ALT": "alt",
+    "SHIFT": "shift",
+    "SUPER": "super",
+    "META": "meta",
+    "WIN": "super",
+    "DELETE": "Delete",
+    "HOME": "Home",
+    "END": "End",
+    "PAGEUP": "Page_Up",
+    "PAGEDOWN": "Page_Down",
+}
+
 class DockerComputer(Computer):
     environment = "linux"
     dimensions = (1280, 720)  # Default fallback; will be updated in __enter__.
@@ -20,6 +65,8 @@ class DockerComputer(Computer):
         compose_file="docker-compose.yml",
         compose_project="computer-user-agent",
         shutdown_on_exit=False,
+        screenshot_format="jpeg",
+        screenshot_quality=80,
     ):
         """
         Initialize the DockerComputer.
@@ -32,6 +79,8 @@ class DockerComputer(Computer):
             compose_file: Path to docker-compose.yml file
             compose_project: Docker compose project name
             shutdown_on_exit: Whether to shutdown the container on exit (default: False)
+            screenshot_format: Screenshot image format: "jpeg", "webp" or "png"
+            screenshot_quality: Quality for lossy screenshot formats (1-100)
         """
         self.container_name = container_name
         self.display = display
@@ -39,90 +88,98 @@ class DockerComputer(Computer):
         self.novnc_port = novnc_port or self._find_available_port(6080)
         self.compose_file = compose_file
         self.compose_project = compose_project
+        # Environment and commands for docker-compose, built once
+        self._compose_env = {
+            **os.environ,
+            "VNC_PORT": str(self.vnc_port),
+            "NOVNC_PORT": str(self.novnc_port),
+            "DISPLAY_NUM": self.display.replace(":", ""),
+        }
+        compose_base = ["docker-compose", "-f", self.compose_file, "-p", self.compose_project]
+        self._compose_up_cmd = [*compose_base, "up", "-d", "--build"]
+        self._compose_down_cmd = [*compose_base, "down"]
         self.shutdown_on_exit = shutdown_on_exit
+        self.screenshot_format = screenshot_format
+        self.screenshot_quality = screenshot_quality
         self._current_url = None  # For browser integration if needed
         self.container_started_by_us = False  # Track if we started the container
+        self._docker_client = None  # Docker SDK client, created on first use
+        # Every docker exec exports DISPLAY, so commands need no env prefix
+        self._display_env = ["-e", f"DISPLAY={self.display}"]
+        self._proc = None  # Persistent `docker exec -i ... sh` session
+        self._session_lock = threading.Lock()
+        self._helper = None  # Persistent container_agent.py session
+        self._helper_lock = threading.Lock()
+        self._last_hash = None  # Digest of the last screenshot taken
+        self._last_b64 = None  # Base64 encoding of the last screenshot taken
+        self._url_cache = (None, None)  # (screenshot hash, URL) of the last URL lookup
+        # Screenshots are read into one reusable buffer; the lock guards it
+        # from capture until the data has been hashed/encoded
+        self._screenshot_buf = bytearray(_SCREENSHOT_BUFFER_SIZE)
+        self._screenshot_lock = threading.Lock()
+        self._enter_count = 0  # Nesting depth of `with` blocks; setup runs on the first only
+        self._settled = False  # Whether the startup settle delay has been applied
 
     def _find_available_port(self, preferred_port):
-        """Find an available port, starting with the preferred port."""
-        port = preferred_port
+        """
+        Find an available port, starting with the preferred port.
+        A port counts as available if it can be bound, which also catches
+        ports that nothing listens on but that can't be reused yet.
+        """
         max_attempts = 10
         
-        for _ in range(max_attempts):
-            try:
-                # Check if the port is in use
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(1)
-                result = sock.connect_ex(('localhost', port))
-                sock.close()
-                
-                # If port is available (connection failed)
-                if result != 0:
+        for port in range(preferred_port, preferred_port + max_attempts):
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                try:
+                    sock.bind(("", port))
                     return port
-                
-                # Port is in use, try the next one
-                port += 1
-            except:
-                # If we hit an error, move to the next port
-                port += 1
+                except OSError:
+                    continue
         
         # If we couldn't find an available port, return the last one we tried
         return port
 
+    @property
+    def _docker(self) -> "docker.DockerClient":
+        """Docker SDK client; talks to the daemon socket over one connection."""
+        if self._docker_client is None:
+            # Imported here so the computers package imports without the SDK
+            import docker
+            self._docker_client = docker.from_env()
+        return self._docker_client
+
+    def _get_running_container(self):
+        """Return the running container, or None if it isn't running."""
+        containers = self._docker.containers.list(filters={"name": self.container_name})
+        return containers[0] if containers else None
+
+    def _wait_until_healthy(self, container):
+        """Poll the container health status until healthy or _HEALTH_TIMEOUT."""
+        deadline = time.monotonic() + _HEALTH_TIMEOUT
+        while time.monotonic() < deadline:
+            container.reload()
+            status = container.attrs["State"].get("Health", {}).get("Status")
+            if status == "healthy":
+                return
+            time.sleep(_HEALTH_INTERVAL)
+        print(f"Container {self.container_name} not reported healthy after {_HEALTH_TIMEOUT:.0f}s, continuing")
+
     def _start_container(self):
         """Start the Docker container using docker-compose with environment variables."""
         try:
             # Check if the container is already running
-            result = subprocess.run(
-                ["docker", "ps", "-q", "-f", f"name={self.container_name}"],
-                capture_output=True,
-                text=True,
-            )
-            
-            if result.stdout.strip():
+            if self._get_running_container() is not None:
                 print(f"Container {self.container_name} is already running")
                 return
             
-            # Prepare environment variables for docker-compose
-            env = os.environ.copy()
-            env.update({
-                "VNC_PORT": str(self.vnc_port),
-                "NOVNC_PORT": str(self.novnc_port),
-                "DISPLAY_NUM": self.display.replace(":", "")
-            })
-            
             # Start the container using docker-compose with environment variables
             print(f"Starting container {self.container_name} with VNC port {self.vnc_port} and noVNC port {self.novnc_port}")
-            subprocess.run(
-                [
-                    "docker-compose", 
-                    "-f", self.compose_file, 
-                    "-p", self.compose_project,
-                    "up", "-d", "--build"
-                ],
-                env=env,
-                check=True
-            )
+            subprocess.run(self._compose_up_cmd, env=self._compose_env, check=True)
             
             # Wait for container to be ready
-            max_attempts = 10
-            for attempt in range(max_attempts):
-                time.sleep(2)  # Wait for container to start
-                try:
-                    health_check = subprocess.run(
-                        ["docker", "inspect", "--format", "{{.State.Health.Status}}", self.container_name],
-                        capture_output=True,
-                        text=True,
-                    )
-                    status = health_check.stdout.strip()
-                    
-                    if status == "healthy" or attempt == max_attempts - 1:
-                        break
-                    
-                    print(f"Waiting for container to be ready... (attempt {attempt+1}/{max_attempts})")
-                except:
-                    # Container might not be created yet
-                    print(f"Waiting for container to start... (attempt {attempt+1}/{max_attempts})")
+            print(f"Waiting for container {self.container_name} to be ready...")
+            self._wait_until_healthy(self._docker.containers.get(self.container_name))
             
             self.container_started_by_us = True
             print(f"Container {self.container_name} started successfully")
@@ -136,23 +193,7 @@ class DockerComputer(Computer):
         if self.container_started_by_us and self.shutdown_on_exit:
             try:
                 print(f"Stopping container {self.container_name}")
-                env = os.environ.copy()
-                env.update({
-                    "VNC_PORT": str(self.vnc_port),
-                    "NOVNC_PORT": str(self.novnc_port),
-                    "DISPLAY_NUM": self.display.replace(":", "")
-                })
-                
-                subprocess.run(
-                    [
-                        "docker-compose",
-                        "-f", self.compose_file,
-                        "-p", self.compose_project,
-                        "down"
-                    ],
-                    env=env,
-                    check=True
-                )
+                subprocess.run(self._compose_down_cmd, env=self._compose_env, check=True)
                 print(f"Container {self.container_name} stopped")
             except Exception as e:
                 print(f"Error stopping container: {e}")
@@ -160,186 +201,424 @@ class DockerComputer(Computer):
             print(f"Container {self.container_name} left running (shutdown_on_exit=False)")
 
     def __enter__(self):
+        # Nested entry reuses the sessions opened by the outermost one
+        if self._enter_count:
+            self._enter_count += 1
+            return self
+
         # Start the container if needed
         self._start_container()
         
         # Check if the container is running
-        result = subprocess.run(
-            ["docker", "ps", "-q", "-f", f"name={self.container_name}"],
-            capture_output=True,
-            text=True,
-        )
-
-        if not result.stdout.strip():
+        if self._get_running_container() is None:
             raise RuntimeError(
                 f"Container {self.container_name} is not running. "
                 f"Check the logs using: docker logs {self.container_name}"
             )
 
-        # Give the container a moment to fully initialize
-        time.sleep(2)
+        self._settle()
+
+        self._open_session()
+        self._open_helper()
         
         # Fetch display geometry
-        geometry = self._exec(
-            f"DISPLAY={self.display} xdotool getdisplaygeometry"
-        ).strip()
+        geometry = self._helper_call("geometry")
+        if geometry is not None:
+            geometry = geometry.decode()
+        else:
+            geometry = self._exec("xdotool getdisplaygeometry").strip()
         if geometry:
             w, h = geometry.split()
             self.dimensions = (int(w), int(h))
+        self._enter_count = 1
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        self._enter_count = max(self._enter_count - 1, 0)
+        if self._enter_count:
+            return
+        self._close_helper()
+        self._close_session()
         # Stop the container if we started it and shutdown_on_exit is True
         self._stop_container()
 
+    def _settle(self):
+        """Give a freshly started container a moment to fully initialize, once."""
+        if self.container_started_by_us and not self._settled:
+            time.sleep(2)
+        self._settled = True
+
+    def peek_dimensions(self) -> Tuple[int, int]:
+        """
+        Start the container if needed and return the display geometry from a
+        one-off query, without opening the shell and helper sessions.
+        """
+        self._start_container()
+        self._settle()
+        geometry = self._exec_once("xdotool getdisplaygeometry").strip()
+        if geometry:
+            w, h = geometry.split()
+            self.dimensions = (int(w), int(h))
+        return self.dimensions
+
+    def _open_session(self):
+        """
+        Open a long-lived shell in the container. Commands are fed to it over
+        stdin, which avoids spawning a new docker exec (and sh) per action.
+        """
+        self._proc = subprocess.Popen(
+            ["docker", "exec", "-i", *self._display_env, self.container_name, "sh"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        # Scratch files that buffer each command's stdout (so its size is
+        # known) and stderr; removed when the shell exits (stdin closed in
+        # _close_session)
+        self._proc.stdin.write(b"_out=$(mktemp); _err=$(mktemp); trap 'rm -f \"$_out\" \"$_err\"' EXIT\n")
+        self._proc.stdin.flush()
+
+    def _close_session(self):
+        """Close the persistent shell session, if open."""
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+            proc.wait(timeout=2)
+        except Exception:
+            proc.kill()
+
+    def _open_helper(self):
+        """
+        Start container_agent.py in the container. It holds one X display
+        connection for all input events and screenshots; if it can't be
+        started (e.g. an older image), actions fall back to xdotool.
+        """
+        self._helper = subprocess.Popen(
+            ["docker", "exec", "-i", *self._display_env, self.container_name, "python3", _HELPER_PATH],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def _close_helper(self):
+        """Stop the container_agent.py session, if running."""
+        helper, self._helper = self._helper, None
+        if helper is None:
+            return
+        try:
+            helper.stdin.close()
+            helper.wait(timeout=2)
+        except Exception:
+            helper.kill()
+
+    def _read_into_buffer(self, stream, size: int) -> memoryview:
+        """
+        Read exactly 'size' bytes from 'stream' into the screenshot buffer and
+        return a view of them. The view is only valid until the next read;
+        callers must hold _screenshot_lock.
+        """
+        if size > len(self._screenshot_buf):
+            self._screenshot_buf = bytearray(max(size, 2 * len(self._screenshot_buf)))
+        view = memoryview(self._screenshot_buf)[:size]
+        read = 0
+        while read < size:
+            n = stream.readinto(view[read:])
+            if not n:
+                raise RuntimeError("stream closed")
+            read += n
+        return view
+
+    def _helper_call(self, op: str, into_buffer: bool = False, **params) -> Optional[bytes]:
+        """
+        Send one request to container_agent.py and return the payload, or
+        None if the helper isn't available or couldn't handle the request,
+        in which case the caller falls back to xdotool.
+        With into_buffer, the payload is read into the screenshot buffer and
+        returned as a memoryview (see _read_into_buffer).
+        """
+        if self._helper is None:
+            return None
+
+        request = json.dumps({"op": op, **params}).encode("utf-8") + b"\n"
+        with self._helper_lock:
+            # Another thread may have closed the helper since the check above
+            helper = self._helper
+            if helper is None:
+                return None
+            try:
+                helper.stdin.write(request)
+                helper.stdin.flush()
+                header = json.loads(helper.stdout.readline())
+                size = header.get("size", 0)
+                if into_buffer:
+                    payload = self._read_into_buffer(helper.stdout, size)
+                else:
+                    payload = helper.stdout.read(size)
+            except (OSError, RuntimeError, ValueError) as e:
+                print(f"Input helper unavailable ({e}), falling back to xdotool")
+                self._close_helper()
+                return None
+
+        if not header["ok"]:
+            print(f"Input helper could not run {op}: {header['error']}")
+            return None
+        return payload
+
+    def _session_run(self, cmd: str, stderr: bool = True, into_buffer: bool = False) -> Tuple[int, bytes]:
+        """
+        Run 'cmd' in the persistent shell session and return its exit status
+        and raw output. The output is buffered in the container and sent back
+        length-prefixed, so binary output (e.g. PNG data) survives intact.
+        The output is the command's stdout; if the command fails and stderr
+        is True, its stderr is appended so the caller can report it. With
+        into_buffer, the output is read into the screenshot buffer and
+        returned as a memoryview (see _read_into_buffer).
+        """
+        # The command's stdin is detached so it can't swallow the protocol.
+        if stderr:
+            redirect = '2>"$_err"'
+            on_failure = '[ $_status -eq 0 ] || cat "$_err" >>"$_out"\n'
+        else:
+            redirect = "2>/dev/null"
+            on_failure = ""
+        script = (
+            f"{{ {cmd}\n}} </dev/null >\"$_out\" {redirect}\n"
+            "_status=$?\n"
+            f"{on_failure}"
+            f"printf '{_SENTINEL}%d %d\\n' $_status $(wc -c <\"$_out\")\n"
+            'cat "$_out"\n'
+        )
+        with self._session_lock:
+            # Another thread may have closed the session after a failure
+            proc = self._proc
+            if proc is None:
+                raise RuntimeError("shell session closed")
+            proc.stdin.write(script.encode("utf-8"))
+            proc.stdin.flush()
+            while True:
+                line = proc.stdout.readline()
+                if not line:
+                    raise RuntimeError("shell session closed")
+                # Anything else on stdout is noise from the shell itself
+                if line.startswith(_SENTINEL.encode()):
+                    status, size = map(int, line[len(_SENTINEL):].split())
+                    break
+            if into_buffer:
+                output = self._read_into_buffer(proc.stdout, size)
+            else:
+                output = proc.stdout.read(size)
+                if len(output) < size:
+                    raise RuntimeError("shell session closed")
+        return status, output
+
     def _exec(self, cmd: str) -> str:
         """
-        Run 'cmd' in the container.
-        We wrap cmd in double quotes and escape any double quotes inside it,
-        so spaces or quotes don't break the shell call.
+        Run 'cmd' in the container through the persistent shell session.
+        Falls back to a one-off docker exec when no session is open.
         """
-        # Escape any existing double quotes in cmd
-        safe_cmd = cmd.replace('"', '\\"')
+        if self._proc is None:
+            return self._exec_once(cmd)
+
+        try:
+            status, output = self._session_run(cmd)
+        except (OSError, RuntimeError, ValueError) as e:
+            print(f"Shell session failed ({e}), falling back to docker exec")
+            self._close_session()
+            return self._exec_once(cmd)
+
+        output = output.decode("utf-8", errors="ignore")
+        if status != 0:
+            print(f"Error executing command: {cmd}")
+            print(f"Error output: {output or 'None'}")
+            return ""
+        return output
 
-        # Then wrap the entire cmd in double quotes for `sh -c`
-        docker_cmd = f'docker exec {self.container_name} sh -c "{safe_cmd}"'
+    def _exec_bytes(self, cmd: str, into_buffer: bool = False) -> bytes:
+        """
+        Run 'cmd' in the container and return its raw stdout as bytes, or as
+        a memoryview of the screenshot buffer with into_buffer.
+        """
+        if self._proc is not None:
+            try:
+                status, output = self._session_run(cmd, stderr=False, into_buffer=into_buffer)
+            except (OSError, RuntimeError, ValueError) as e:
+                print(f"Shell session failed ({e}), falling back to docker exec")
+                self._close_session()
+            else:
+                if status != 0:
+                    print(f"Error executing command: {cmd}")
+                    return b""
+                return output
 
         try:
-            return subprocess.check_output(docker_cmd, shell=True).decode(
-                "utf-8", errors="ignore"
+            return subprocess.check_output(
+                ["docker", "exec", *self._display_env, self.container_name, "sh", "-c", cmd],
+                stderr=subprocess.DEVNULL,
             )
-        except subprocess.CalledProcessError as e:
+        except subprocess.CalledProcessError:
+            print(f"Error executing command: {cmd}")
+            return b""
+
+    def _exec_once(self, cmd: str) -> str:
+        """
+        Run 'cmd' in the container with a one-off docker exec.
+        The command is passed as a single argument to `sh -c` in the
+        container, so no host shell is involved and no escaping is needed.
+        """
+        result = subprocess.run(
+            ["docker", "exec", *self._display_env, self.container_name, "sh", "-c", cmd],
+            capture_output=True,
+        )
+        if result.returncode != 0:
+            # Only show stderr on failure; on success the output is parsed as data
+            output = (result.stdout + result.stderr).decode("utf-8", errors="ignore")
             print(f"Error executing command: {cmd}")
-            print(f"Error output: {e.output.decode('utf-8', errors='ignore') if e.output else 'None'}")
+            print(f"Error output: {output or 'None'}")
             return ""
+        return result.stdout.decode("utf-8", errors="ignore")
 
     def screenshot(self) -> str:
         """
-        Takes a screenshot with ImageMagick (import), returning base64-encoded PNG.
-        Requires 'import'.
+        Takes a screenshot, returning it base64-encoded in screenshot_format.
+        If the screen is unchanged since the last call, the previously encoded
+        string is returned as is.
         """
-        cmd = (
-            f"export DISPLAY={self.display} && "
-            "import -window root png:- | base64 -w 0"
-        )
+        with self._screenshot_lock:
+            raw = self._capture_screenshot()
+            digest = hashlib.blake2b(raw, digest_size=16).digest()
+            if digest != self._last_hash:
+                self._last_hash = digest
+                self._last_b64 = base64.b64encode(raw).decode("ascii")
+            return self._last_b64
+
+    @property
+    def screenshot_mime_type(self) -> str:
+        """MIME type of the images returned by screenshot()."""
+        return f"image/{self.screenshot_format}"
 
-        return self._exec(cmd)
+    @property
+    def screenshot_hash(self) -> Optional[bytes]:
+        """Digest of the last screenshot, usable to detect screen changes."""
+        return self._last_hash
 
     def get_screenshot_bytes(self) -> bytes:
         """
-        Return the screenshot as bytes instead of base64 string
+        Return the screenshot as raw image bytes instead of base64 string.
         """
-        base64_str = self.screenshot()
-        return base64.b64decode(base64_str)
+        with self._screenshot_lock:
+            return bytes(self._capture_screenshot())
+
+    def _capture_screenshot(self) -> memoryview:
+        """
+        Capture the screen into the screenshot buffer, without copying.
+        Falls back to ImageMagick (import) if the helper is unavailable.
+        Callers must hold _screenshot_lock while using the result.
+        """
+        image = self._helper_call(
+            "screenshot", into_buffer=True, format=self.screenshot_format, quality=self.screenshot_quality
+        )
+        if image is not None:
+            return image
+
+        quality = "" if self.screenshot_format == "png" else f"-quality {self.screenshot_quality} "
+        cmd = f"import -window root {quality}{self.screenshot_format}:-"
+        return memoryview(self._exec_bytes(cmd, into_buffer=True))
 
     def click(self, x: int, y: int, button: str = "left") -> None:
         button_map = {"left": 1, "middle": 2, "right": 3}
         b = button_map.get(button, 1)
-        self._exec(f"DISPLAY={self.display} xdotool mousemove {x} {y} click {b}")
+        if self._helper_call("click", x=x, y=y, button=b) is not None:
+            return
+        self._exec(f"xdotool mousemove {x} {y} click {b}")
 
     def double_click(self, x: int, y: int) -> None:
+        if self._helper_call("click", x=x, y=y, button=1, repeat=2) is not None:
+            return
         self._exec(
-            f"DISPLAY={self.display} xdotool mousemove {x} {y} click --repeat 2 1"
+            f"xdotool mousemove {x} {y} click --repeat 2 1"
         )
 
     def scroll(self, x: int, y: int, scroll_x: int, scroll_y: int) -> None:
         """
         For simple vertical scrolling: xdotool click 4 (scroll up) or 5 (scroll down).
+        The move and all wheel clicks are sent in a single xdotool call.
         """
-        self._exec(f"DISPLAY={self.display} xdotool mousemove {x} {y}")
         clicks = abs(scroll_y)
         button = 4 if scroll_y < 0 else 5
-        for _ in range(clicks):
-            self._exec(f"DISPLAY={self.display} xdotool click {button}")
+        if self._helper_call("click", x=x, y=y, button=button, repeat=clicks, delay=0.02) is not None:
+            return
+        cmd = f"xdotool mousemove {x} {y}"
+        if clicks:
+            cmd += f" click --repeat {clicks} --delay 20 {button}"
+        self._exec(cmd)
 
     def type(self, text: str) -> None:
         """
         Type the given text via xdotool, properly handling newlines.
+        The text is piped to a single `xdotool type --file -`, which presses
+        Return for each newline, so multi-line text needs only one call.
         """
-        # If text contains newlines, split and handle separately
-        if '\n' in text:
-            lines = text.split('\n')
-            for i, line in enumerate(lines):
-                if i > 0:
-                    # Press Return/Enter for newlines
-                    self._exec(f"DISPLAY={self.display} xdotool key Return")
-                    time.sleep(0.1)  # Small delay after Return
-                
-                if line:  # Only type if there's text in this line
-                    # Escape single quotes in the line text
-                    safe_text = line.replace("'", "'\\''")
-                    # Type the line
-                    cmd = f"DISPLAY={self.display} xdotool type -- '{safe_text}'"
-                    self._exec(cmd)
-                    time.sleep(0.1)  # Small delay after typing
-        else:
-            # Original approach for text without newlines
-            safe_text = text.replace("'", "'\\''")
-            cmd = f"DISPLAY={self.display} xdotool type -- '{safe_text}'"
-            self._exec(cmd)
+        if self._helper_call("type", text=text) is not None:
+            return
+
+        self._exec(f"printf '%s' {shlex.quote(text)} | xdotool type --file -")
 
     def wait(self, ms: int = 1000) -> None:
         time.sleep(ms / 1000)
 
     def move(self, x: int, y: int) -> None:
-        self._exec(f"DISPLAY={self.display} xdotool mousemove {x} {y}")
+        if self._helper_call("move", x=x, y=y) is not None:
+            return
+        self._exec(f"xdotool mousemove {x} {y}")
 
     def keypress(self, keys: List[str]) -> None:
-        mapping = {
-            "ENTER": "Return",
-            "LEFT": "Left",
-            "RIGHT": "Right",
-            "UP": "Up",
-            "DOWN": "Down",
-            "ESC": "Escape",
-            "SPACE": "space",
-            "BACKSPACE": "BackSpace",
-            "TAB": "Tab",
-            "CTRL": "ctrl",
-            "ALT": "alt",
-            "SHIFT": "shift",
-            "SUPER": "super",
-            "META": "meta",
-            "WIN": "super",
-            "DELETE": "Delete",
-            "HOME": "Home",
-            "END": "End",
-            "PAGEUP": "Page_Up",
-            "PAGEDOWN": "Page_Down",
-        }
-        mapped_keys = [mapping.get(key, key) for key in keys]
-        combo = "+".join(mapped_keys)
-        self._exec(f"DISPLAY={self.display} xdotool key {combo}")
+        mapped_keys = [_KEY_MAP.get(key, key) for key in keys]
+        if self._helper_call("key", keys=mapped_keys) is not None:
+            return
+        self._exec(f"xdotool key {'+'.join(mapped_keys)}")
 
     def drag(self, path: List[Dict[str, int]]) -> None:
         if not path:
             return
+        if self._helper_call("drag", path=path) is not None:
+            return
         start_x = path[0]["x"]
         start_y = path[0]["y"]
-        self._exec(
-            f"DISPLAY={self.display} xdotool mousemove {start_x} {start_y} mousedown 1"
-        )
+        # Chain the whole drag into one xdotool call
+        cmd = f"xdotool mousemove {start_x} {start_y} mousedown 1"
         for point in path[1:]:
-            self._exec(f"DISPLAY={self.display} xdotool mousemove {point['x']} {point['y']}")
-        self._exec(f"DISPLAY={self.display} xdotool mouseup 1")
+            cmd += f" mousemove {point['x']} {point['y']}"
+        cmd += " mouseup 1"
+        self._exec(cmd)
     
-    def get_current_url(self) -> str:
+    def get_current_url(self, screen_hash: Optional[bytes] = None) -> str:
         """
         Attempt to get the current URL from Firefox browser if running.
         This is a basic implementation and might need improvement.
+        Callers that already took a screenshot can pass its screenshot_hash:
+        the URL is then cached against it, and looked up again only once the
+        screen has changed. Without a hash the URL is always looked up, so
+        the lookup can run concurrently with a screenshot.
         """
+        if screen_hash is not None and self._url_cache[0] == screen_hash:
+            return self._url_cache[1]
+
         try:
             # Try to get URL from Firefox using xdotool
-            cmd = f"DISPLAY={self.display} xdotool search --onlyvisible --class Firefox getwindowname"
+            cmd = "xdotool search --onlyvisible --class Firefox getwindowname"
             window_name = self._exec(cmd).strip()
             
             # Firefox usually has the URL or page title in the window name
             if window_name and " - Mozilla Firefox" in window_name:
-                title = window_name.replace(" - Mozilla Firefox", "")
-                return title
-            
-            # Fallback to stored URL
-            return self._current_url or "unknown"
+                url = window_name.replace(" - Mozilla Firefox", "")
+            else:
+                # Fallback to stored URL
+                url = self._current_url or "unknown"
+            if screen_hash is not None:
+                self._url_cache = (screen_hash, url)
+            return url
         except Exception as e:
             print(f"Error getting current URL: {e}")
             return "unknown"
@@ -0,0 +1,289 @@
+# container_agent.py
+"""
+Input/screenshot helper that runs inside the desktop container.
+
+It keeps a single X display connection open and serves requests read from
+stdin, so the host can drive the desktop through one long-lived
+`docker exec -i` session instead of spawning xdotool/ImageMagick per action.
+
+Protocol: one JSON request per line, e.g. {"op": "click", "x": 10, "y": 20}.
+Each response is a JSON header line {"ok": true, "size": N} followed by N
+bytes of payload, or {"ok": false, "error": "..."} if the request failed.
+"""
+import ctypes
+import ctypes.util
+import io
+import json
+import sys
+import time
+
+from PIL import Image
+from Xlib import X, XK, display as xdisplay
+from Xlib.ext import xtest
+
+# xdotool-style modifier names mapped to X keysym names
+MODIFIERS = {
+    "ctrl": "Control_L",
+    "control": "Control_L",
+    "alt": "Alt_L",
+    "shift": "Shift_L",
+    "super": "Super_L",
+    "meta": "Meta_L",
+}
+
+# Characters that don't map to a keysym by code point
+SPECIAL_CHARS = {
+    "\n": XK.XK_Return,
+    "\t": XK.XK_Tab,
+}
+
+TYPE_DELAY = 0.008  # Seconds between typed characters
+
+
+class UnsupportedInput(Exception):
+    """Raised for input that the helper cannot synthesize; the host falls back to xdotool."""
+
+
+class XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong),
+        ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p),
+        ("readOnly", ctypes.c_int),
+    ]
+
+
+class XImage(ctypes.Structure):
+    # Leading fields of Xlib's XImage; only these are accessed
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int),
+    ]
+
+
+class ShmCapture:
+    """
+    Captures the root window through the MIT-SHM extension. The X server
+    writes the framebuffer straight into a shared memory segment that is
+    allocated once and reused for every capture, so no pixel data goes
+    over the X socket.
+    """
+
+    IPC_PRIVATE = 0
+    IPC_CREAT = 0o1000
+    IPC_RMID = 0
+    ALL_PLANES = 0xFFFFFFFFFFFFFFFF
+
+    def __init__(self):
+        xlib = ctypes.CDLL(ctypes.util.find_library("X11"))
+        xext = ctypes.CDLL(ctypes.util.find_library("Xext"))
+        libc = ctypes.CDLL(None, use_errno=True)
+
+        xlib.XOpenDisplay.restype = ctypes.c_void_p
+        xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        xlib.XDefaultVisual.restype = ctypes.c_void_p
+        xlib.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XRootWindow.restype = ctypes.c_ulong
+        xlib.XRootWindow.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        for name in ("XDefaultScreen",):
+            getattr(xlib, name).argtypes = [ctypes.c_void_p]
+        for name in ("XDefaultDepth", "XDisplayWidth", "XDisplayHeight"):
+            getattr(xlib, name).argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+        xext.XShmCreateImage.restype = ctypes.POINTER(XImage)
+        xext.XShmCreateImage.argtypes = [
+            ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+            ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo), ctypes.c_uint, ctypes.c_uint,
+        ]
+        xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo)]
+        xext.XShmGetImage.argtypes = [
+            ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(XImage),
+            ctypes.c_int, ctypes.c_int, ctypes.c_ulong,
+        ]
+        libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        libc.shmat.restype = ctypes.c_void_p
+        libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+        self.xext = xext
+        self.dpy = xlib.XOpenDisplay(None)
+        if not self.dpy:
+            raise RuntimeError("Cannot open display")
+        if not xext.XShmQueryExtension(self.dpy):
+            raise RuntimeError("MIT-SHM extension not available")
+
+        screen = xlib.XDefaultScreen(self.dpy)
+        self.root = xlib.XRootWindow(self.dpy, screen)
+        self.width = xlib.XDisplayWidth(self.dpy, screen)
+        self.height = xlib.XDisplayHeight(self.dpy, screen)
+
+        self.info = XShmSegmentInfo()
+        self.image = xext.XShmCreateImage(
+            self.dpy, xlib.XDefaultVisual(self.dpy, screen), xlib.XDefaultDepth(self.dpy, screen),
+            X.ZPixmap, None, ctypes.byref(self.info), self.width, self.height,
+        )
+        if not self.image:
+            raise RuntimeError("XShmCreateImage failed")
+        if self.image.contents.bits_per_pixel != 32:
+            raise RuntimeError(f"Unsupported pixel size {self.image.contents.bits_per_pixel}")
+
+        self.stride = self.image.contents.bytes_per_line
+        size = self.stride * self.height
+        self.info.shmid = libc.shmget(self.IPC_PRIVATE, size, self.IPC_CREAT | 0o600)
+        if self.info.shmid < 0:
+            raise OSError(ctypes.get_errno(), "shmget failed")
+        self.info.shmaddr = libc.shmat(self.info.shmid, None, 0)
+        # shmat returns (void *) -1 on failure
+        if self.info.shmaddr in (None, ctypes.c_void_p(-1).value):
+            errno = ctypes.get_errno()
+            libc.shmctl(self.info.shmid, self.IPC_RMID, None)
+            raise OSError(errno, "shmat failed")
+        self.info.readOnly = 0
+        self.image.contents.data = self.info.shmaddr
+        if not xext.XShmAttach(self.dpy, ctypes.byref(self.info)):
+            raise RuntimeError("XShmAttach failed")
+        xlib.XSync(self.dpy, 0)
+        # Mark the segment for removal once both sides have detached
+        libc.shmctl(self.info.shmid, self.IPC_RMID, None)
+
+        self.pixels = memoryview((ctypes.c_char * size).from_address(self.info.shmaddr))
+
+    def capture(self) -> Image.Image:
+        if not self.xext.XShmGetImage(self.dpy, self.root, self.image, 0, 0, self.ALL_PLANES):
+            raise RuntimeError("XShmGetImage failed")
+        return Image.frombytes("RGB", (self.width, self.height), self.pixels, "raw", "BGRX", self.stride)
+
+
+class XServer:
+    """Holds the X display connection and implements the supported operations."""
+
+    def __init__(self):
+        self.display = xdisplay.Display()
+        self.root = self.display.screen().root
+        try:
+            self.shm = ShmCapture()
+        except Exception as e:
+            print(f"MIT-SHM capture unavailable, using XGetImage: {e}", file=sys.stderr)
+            self.shm = None
+
+    def geometry(self) -> bytes:
+        screen = self.display.screen()
+        return f"{screen.width_in_pixels} {screen.height_in_pixels}".encode()
+
+    def move(self, x: int, y: int) -> bytes:
+        xtest.fake_input(self.display, X.MotionNotify, x=x, y=y)
+        self.display.sync()
+        return b""
+
+    def click(self, x: int, y: int, button: int = 1, repeat: int = 1, delay: float = 0.0) -> bytes:
+        xtest.fake_input(self.display, X.MotionNotify, x=x, y=y)
+        for i in range(repeat):
+            if i and delay:
+                self.display.sync()
+                time.sleep(delay)
+            xtest.fake_input(self.display, X.ButtonPress, button)
+            xtest.fake_input(self.display, X.ButtonRelease, button)
+        self.display.sync()
+        return b""
+
+    def drag(self, path: list) -> bytes:
+        start, rest = path[0], path[1:]
+        xtest.fake_input(self.display, X.MotionNotify, x=start["x"], y=start["y"])
+        xtest.fake_input(self.display, X.ButtonPress, 1)
+        for point in rest:
+            self.display.sync()
+            xtest.fake_input(self.display, X.MotionNotify, x=point["x"], y=point["y"])
+        xtest.fake_input(self.display, X.ButtonRelease, 1)
+        self.display.sync()
+        return b""
+
+    def key(self, keys: list) -> bytes:
+        """Press the keys (X keysym names or xdotool modifier names) as one combo."""
+        keycodes = []
+        for name in keys:
+            keysym = XK.string_to_keysym(MODIFIERS.get(name.lower(), name))
+            keycode = self.display.keysym_to_keycode(keysym) if keysym else 0
+            if not keycode:
+                raise UnsupportedInput(f"No keycode for key {name!r}")
+            keycodes.append(keycode)
+        for keycode in keycodes:
+            xtest.fake_input(self.display, X.KeyPress, keycode)
+        for keycode in reversed(keycodes):
+            xtest.fake_input(self.display, X.KeyRelease, keycode)
+        self.display.sync()
+        return b""
+
+    def type(self, text: str) -> bytes:
+        # Resolve every character first so nothing is typed if one can't be
+        strokes = [self._char_to_stroke(char) for char in text]
+        shift = self.display.keysym_to_keycode(XK.XK_Shift_L)
+        for keycode, shifted in strokes:
+            if shifted:
+                xtest.fake_input(self.display, X.KeyPress, shift)
+            xtest.fake_input(self.display, X.KeyPress, keycode)
+            xtest.fake_input(self.display, X.KeyRelease, keycode)
+            if shifted:
+                xtest.fake_input(self.display, X.KeyRelease, shift)
+            self.display.sync()
+            time.sleep(TYPE_DELAY)
+        return b""
+
+    def _char_to_stroke(self, char: str):
+        """Return (keycode, needs_shift) for a character on the current keymap."""
+        keysym = SPECIAL_CHARS.get(char)
+        if keysym is None:
+            code = ord(char)
+            # Latin-1 keysyms equal the code point, the rest use the Unicode range
+            keysym = code if 0x20 <= code <= 0x7E or 0xA0 <= code <= 0xFF else 0x01000000 | code
+        for keycode, index in self.display.keysym_to_keycodes(keysym):
+            if index in (0, 1):
+                return keycode, index == 1
+        raise UnsupportedInput(f"No keycode for character {char!r}")
+
+    def screenshot(self, format: str = "png", quality: int = 80) -> bytes:
+        if self.shm is not None:
+            image = self.shm.capture()
+        else:
+            screen = self.display.screen()
+            width, height = screen.width_in_pixels, screen.height_in_pixels
+            raw = self.root.get_image(0, 0, width, height, X.ZPixmap, 0xFFFFFFFF)
+            image = Image.frombytes("RGB", (width, height), raw.data, "raw", "BGRX")
+        buffer = io.BytesIO()
+        if format == "png":
+            image.save(buffer, format="PNG")
+        else:
+            image.save(buffer, format=format.upper(), quality=quality)
+        return buffer.getvalue()
+
+
+def main():
+    server = XServer()
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    for line in stdin:
+        try:
+            request = json.loads(line)
+            op = request.pop("op")
+            if op.startswith("_") or not hasattr(server, op):
+                raise UnsupportedInput(f"Unknown op {op!r}")
+            payload = getattr(server, op)(**request)
+            header = {"ok": True, "size": len(payload)}
+        except Exception as e:
+            payload = b""
+            header = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        stdout.write(json.dumps(header).encode() + b"\n" + payload)
+        stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,16 @@
 import gradio as gr
+import asyncio
+import atexit
 import sys
 import os
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
 from pathlib import Path
+import functools
 import json
+import logging
 
 # Ensure the current directory is in the path
 current_dir = Path(__file__).parent.absolute()
@@ -13,137 +21,213 @@ if str(current_dir) not in sys.path:
 from computers.docker_computer import DockerComputer
 from agent.agent import Agent
 
+logger = logging.getLogger(__name__)
+
 # Create global variables for the Docker Computer and Agent
 docker_computer = None
+_computer_session = None  # Entered docker_computer, kept open while connected
+_api_key = None  # Key for the Agent, which is created on the first chat message
 agent = None
 debug_mode = False
-processing = False
-stop_requested = False
+# Set while a message is being processed / when the user asked to stop it
+_busy_evt = threading.Event()
+_stop_evt = threading.Event()
+
+# Streamed chat messages are sent to Gradio after this many new messages or
+# this many seconds, whichever comes first; actions are always sent at once
+_FLUSH_EVERY = 8
+_FLUSH_INTERVAL = 0.05
+
+@dataclass
+class _ChatStream:
+    """Messages of the current turn and how many of them Gradio hasn't seen yet"""
+    messages: list = field(default_factory=list)
+    pending: int = 0
+    last_flush: float = field(default_factory=time.monotonic)
+
+    def add(self, message, urgent=False):
+        """Append a message and return True if the messages should be yielded now"""
+        self.messages.append(message)
+        self.pending += 1
+        now = time.monotonic()
+        if urgent or self.pending >= _FLUSH_EVERY or now - self.last_flush >= _FLUSH_INTERVAL:
+            self.pending = 0
+            self.last_flush = now
+            return True
+        return False
 
 def safety_check_callback(message):
     """Handle safety check prompts from the agent"""
     print(f"Safety Check: {message}")
     return True
 
-def should_stop():
-    """Callback to check if the conversation should stop"""
-    global stop_requested
-    return stop_requested
+@functools.lru_cache(maxsize=256)
+def _dump(params_tuple):
+    """Pretty-print action params; cached since the agent repeats the same actions"""
+    return json.dumps(dict(params_tuple), indent=2)
+
+def format_params(params):
+    """Return the indented JSON for action params, using the cache when they are hashable"""
+    try:
+        # Extractors always build params in the same key order, so the
+        # items tuple is a stable key and keeps the displayed order
+        return _dump(tuple(params.items()))
+    except TypeError:
+        # Unhashable values (e.g. a drag path) are serialized directly
+        return json.dumps(params, indent=2)
+
+def close_computer_session():
+    """Close the long-lived Docker Computer session, if one is open"""
+    global _computer_session
+    
+    if _computer_session is not None:
+        session, _computer_session = _computer_session, None
+        session.__exit__(None, None, None)
+
+atexit.register(close_computer_session)
 
 def init_docker_computer(container_name, display, vnc_port, api_key_input, shutdown_on_exit = False):
-    """Initialize the Docker Computer and Agent"""
-    global docker_computer, agent, debug_mode
+    """Initialize the Docker Computer; the session and Agent are created on the first chat message"""
+    global docker_computer, _api_key, agent
     
     try:
+        # Reconnecting replaces the previous session and agent
+        close_computer_session()
+        docker_computer = agent = None
+        
         # Initialize Docker Computer
-        docker_computer = DockerComputer(
+        computer = DockerComputer(
             container_name=container_name,
             display=display,
             vnc_port=vnc_port,
             shutdown_on_exit=shutdown_on_exit
         )
         
-        # Test connection
-        with docker_computer as computer:
-            dimensions = computer.dimensions
-            
-            # Initialize Agent, passing the api_key (if not found in environment)
-            agent = Agent(
-                api_key=api_key_input,
-                computer=computer,
-                print_steps=True,
-                debug=debug_mode,
-                acknowledge_safety_check_callback=safety_check_callback
-            )
-            
-            return f"Connected to Docker container with dimensions: {dimensions[0]}x{dimensions[1]}"
+        # Start the container and read its geometry without opening the sessions
+        dimensions = computer.peek_dimensions()
+        docker_computer, _api_key = computer, api_key_input
+        
+        return f"Connected to Docker container with dimensions: {dimensions[0]}x{dimensions[1]}"
     except Exception as e:
         error_message = f"Failed to connect to Docker container: {str(e)}"
         if debug_mode:
             error_message += f"\n\nStack trace: {e.__traceback__}"
         return error_message
 
-def chat_with_agent(message, history):
-    """Process a message with the agent and return updates in the format Gradio expects"""
-    global docker_computer, agent, processing, stop_requested
+def start_agent():
+    """Open the long-lived Docker Computer session and create the Agent for it"""
+    global _computer_session, agent
     
+    # Enter once and keep the session open for every chat turn
+    session = docker_computer.__enter__()
+    
+    try:
+        # Initialize Agent, passing the api_key (if not found in environment)
+        agent = Agent(
+            api_key=_api_key,
+            computer=session,
+            print_steps=debug_mode,
+            debug=debug_mode,
+            acknowledge_safety_check_callback=safety_check_callback
+        )
+    except Exception:
+        session.__exit__(None, None, None)
+        raise
+    
+    # Only publish the session once the Agent exists, so a failure is retried cleanly
+    _computer_session = session
+
+async def chat_with_agent(message, history):
+    """Process a message with the agent and stream this turn's messages in the format Gradio expects"""
     # Basic checks
-    if not docker_computer or not agent:
-        return "Please connect to Docker first."
+    if not docker_computer:
+        yield "Please connect to Docker first."
+        return
     
-    if processing:
-        return "Already processing a message. Please wait."
+    busy_evt, stop_evt = _busy_evt, _stop_evt
+    if busy_evt.is_set():
+        yield "Already processing a message. Please wait."
+        return
     
     # Reset stop flag at the start of a new conversation
-    stop_requested = False
+    stop_evt.clear()
     
     # Start processing
-    processing = True
+    busy_evt.set()
+    # One chat message per update; Gradio streams only what was appended,
+    # and consecutive updates are coalesced into one yield
+    stream = _ChatStream()
     
     try:
-        with docker_computer as computer:
-            all_content = ""
+        if agent is None:
+            await asyncio.to_thread(start_agent)
+        
+        # The stop event's bound is_set is the should_stop callback
+        async for update in agent.run_conversation_async(message, should_stop_callback=stop_evt.is_set):                
+            logger.debug("Update received: %s", update)
+            role = update.get("role")
             
-            # Modify run_conversation to use the should_stop callback
-            for update in agent.run_conversation(message, should_stop_callback=should_stop):                
-                print(f"Update received: {update}")  # Debug print
-                
-                if "role" in update and update["role"] == "assistant":
-                    # Add assistant's message
-                    all_content += f"\n\n{update.get('content', '')}"
-                    yield all_content.strip()
-                
-                elif "role" in update and update["role"] == "reasoning":
-                    # Add reasoning
-                    reasoning = update.get("content", "")
-                    all_content += f"\n\n**🧠 Agent Reasoning:**\n{reasoning}"
-                    yield all_content.strip()
-                
-                elif "action" in update:
-                    # Add action
-                    action = update["action"]
-                    params = update.get("params", {})
-                    all_content += f"\n\n**🔄 Action: {action}**\n```\n{json.dumps(params, indent=2)}\n```"
-                    yield all_content.strip()                
-                
-            # Ensure at least one yield happens
-            if not all_content:
-                yield "No response received from the agent."
+            if role == "assistant":
+                # Add assistant's message
+                if stream.add({"role": "assistant", "content": update.get("content", "")}):
+                    yield stream.messages
+            
+            elif role == "reasoning":
+                # Add reasoning
+                if stream.add({
+                    "role": "assistant",
+                    "content": update.get("content", ""),
+                    "metadata": {"title": "🧠 Agent Reasoning"},
+                }):
+                    yield stream.messages
+            
+            elif "action" in update:
+                # Add action; shown immediately
+                action = update["action"]
+                params = update.get("params", {})
+                stream.add({
+                    "role": "assistant",
+                    "content": f"```\n{format_params(params)}\n```",
+                    "metadata": {"title": f"🔄 Action: {action}"},
+                }, urgent=True)
+                yield stream.messages
+            
+        # Send whatever is still buffered; ensure at least one yield happens
+        if stream.pending:
+            yield stream.messages
+        elif not stream.messages:
+            yield "No response received from the agent."
     
     except Exception as e:
-        error_message = f"Error: {str(e)}"
-        if debug_mode and hasattr(e, '__traceback__'):
-            import traceback
-            tb_str = ''.join(traceback.format_exception(type(e), e, e.__traceback__))
-            error_message += f"\n\nStack Trace:\n{tb_str}"
+        error_message = f"Error: {e!r}"
+        if debug_mode and e.__traceback__ is not None:
+            tb_lines = traceback.TracebackException.from_exception(e).format()
+            error_message = "".join((error_message, "\n\nStack Trace:\n", *tb_lines))
         
-        yield error_message
+        stream.add({"role": "assistant", "content": error_message}, urgent=True)
+        yield stream.messages
     
     finally:
-        processing = False
-        stop_requested = False  # Reset the stop flag
+        busy_evt.clear()
+        stop_evt.clear()  # Reset the stop flag
 
 def stop_conversation():
     """Request to stop the current conversation"""
-    global stop_requested, processing
-    
-    if processing:
-        stop_requested = True
+    if _busy_evt.is_set():
+        _stop_evt.set()
         return "Stopping the current operation..."
     else:
         return "No active operation to stop."
 
 def reset_chat_history():
     """Reset the chat history and agent's state"""
-    global agent, stop_requested
-    
     # Reset the stop flag
-    stop_requested = False
+    _stop_evt.clear()
     
     # Reset the agent's conversation state if agent exists
     if agent:
-        agent.last_response_id = None
-        print("Reset agent's last_response_id to None")
+        agent.reset()
+        logger.debug("Reset agent's conversation state")
     
     # Return empty list to reset chat history
     return []
@@ -154,15 +238,18 @@ def toggle_debug_mode(value):
     debug_mode = value
     return value
 
-def get_vnc_html(port):
-    """Generate HTML for the VNC iframe"""
-    vnc_url = f"http://localhost:{port}/vnc.html?autoconnect=true&password=secret&resize=scale"
-    return f"""
+# HTML for the VNC iframe; only the port varies
+_VNC_TEMPLATE = """
     <div style="border: 1px solid #d9d9d9; border-radius: 0.5rem; overflow: hidden; background-color: white; width: 100%; height: 80vh;">
-        <iframe src="{vnc_url}" style="width: 100%; height: 100%; border: none;"></iframe>
+        <iframe src="http://localhost:{port}/vnc.html?autoconnect=true&password=secret&resize=scale" style="width: 100%; height: 100%; border: none;"></iframe>
     </div>
     """
 
+@functools.lru_cache(maxsize=8)
+def get_vnc_html(port):
+    """Generate HTML for the VNC iframe"""
+    return _VNC_TEMPLATE.format(port=port)
+
 # Custom CSS for better layout
 css = """
 .fixed-height-container {
@@ -188,15 +275,11 @@ css = """
 """
 
 # Get the Gradio version
-try:
-    gradio_version = gr.__version__
-    print(f"Gradio version: {gradio_version}")
-except:
-    gradio_version = "unknown"
-    print("Could not determine Gradio version")
+gradio_version = getattr(gr, "__version__", "unknown")
 
 # Get the API key from environment, if available.
 api_key_env = os.environ.get("OPENAI_API_KEY", "")
+_HAS_KEY = bool(api_key_env)
 
 # First try with Blocks and newer components
 with gr.Blocks(title="Computer User Agent", css=css) as demo:
@@ -206,11 +289,11 @@ with gr.Blocks(title="Computer User Agent", css=css) as demo:
         
         # Check for OpenAI API key
         api_status = gr.Markdown(
-            "✅ OpenAI API Key found in environment variables" if api_key_env 
+            "✅ OpenAI API Key found in environment variables" if _HAS_KEY 
             else "⚠️ No OpenAI API Key found in environment."
         )
         # Provide an input for the API key regardless; if found in env, it will be prefilled.
-        api_key_input = gr.Textbox(label="OpenAI API Key", visible=not api_key_env, value=api_key_env, placeholder="Enter your OpenAI API Key")
+        api_key_input = gr.Textbox(label="OpenAI API Key", visible=not _HAS_KEY, value=api_key_env, placeholder="Enter your OpenAI API Key")
         container_name = gr.Textbox(label="Container Name", value="vnc-desktop")
         display = gr.Textbox(label="Display", value=":99")
         vnc_port = gr.Textbox(label="VNC Port", value="6080")
@@ -259,5 +342,11 @@ with gr.Blocks(title="Computer User Agent", css=css) as demo:
     )
 
 if __name__ == "__main__":
+    # uvloop is optional (not available on Windows); install it before any loop is created
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
     print(f"Starting Gradio app (version: {gradio_version})")
     demo.launch()